@@ -5,10 +5,14 @@ I file vengono salvati nella cartella ./data/
 """
 
 import asyncio
-import json
+import contextlib
 import os
+import secrets
+import stat
+from collections.abc import Awaitable
 from pathlib import Path
 
+import orjson
 from dotenv import load_dotenv
 
 from server_client import HackapizzaClient
@@ -22,32 +26,80 @@ API_KEY = os.getenv("API_KEY", "")
 OUT_DIR = Path(__file__).parent / "explorer_data"
 
 
-def save(filename: str, data: object) -> None:
+def _write_json(path: Path, data: object) -> bool:
+    """Scrive `data` in `path`; ritorna False se il file era già identico."""
+    blob = orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    mode: int | None = None
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        pass
+    else:
+        # confronto byte a byte solo se la dimensione coincide
+        if st.st_size == len(blob) and path.read_bytes() == blob:
+            return False
+        mode = stat.S_IMODE(st.st_mode)
+    # scrittura atomica: chi legge explorer_data/ non vede mai un file a metà.
+    # 0o666 come open(): il kernel applica la umask ai file nuovi
+    tmp = path.with_name(f".{path.name}.{secrets.token_hex(4)}.tmp")
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(blob)
+        if mode is not None:
+            # il file esistente mantiene i suoi permessi
+            os.chmod(tmp, mode)
+        os.replace(tmp, path)
+    except Exception:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(tmp)
+        raise
+    return True
+
+
+async def save(filename: str, data: object) -> None:
     OUT_DIR.mkdir(exist_ok=True)
     path = OUT_DIR / filename
-    path.write_text(json.dumps(data, indent=2, ensure_ascii=False), encoding="utf-8")
-    print(f"  salvato -> {path}")
+    # encode + scrittura su disco in un thread, per non bloccare l'event loop
+    written = await asyncio.to_thread(_write_json, path, data)
+    print(f"  {'salvato' if written else 'invariato'} -> {path}")
 
 
-async def main() -> None:
-    async with HackapizzaClient(BASE_URL, API_KEY, TEAM_ID) as client:
-
-        print("ristorante...")
-        save("restaurant.json", await client.get_restaurant())
-
-        print("menu...")
-        save("menu.json", await client.get_menu())
+async def fetch_and_save(filename: str, request: Awaitable[object]) -> None:
+    await save(filename, await request)
 
-        print("ricette...")
-        save("recipes.json", await client.get_recipes())
 
-        print("ristoranti...")
-        save("restaurants.json", await client.get_restaurants())
-
-        print("mercato...")
-        save("market.json", await client.get_market_entries())
-
-    print("\ndone.")
+async def main() -> None:
+    async with HackapizzaClient(BASE_URL, API_KEY, TEAM_ID) as client:
+        # endpoint indipendenti: li lanciamo tutti insieme invece che in serie,
+        # e ogni file viene scritto appena arriva la sua risposta
+        endpoints = {
+            "restaurant.json": client.get_restaurant(),
+            "menu.json": client.get_menu(),
+            "recipes.json": client.get_recipes(),
+            "restaurants.json": client.get_restaurants(),
+            "market.json": client.get_market_entries(),
+        }
+        print(f"fetch di {len(endpoints)} endpoint...")
+        # return_exceptions: un endpoint che fallisce non cancella gli altri
+        results = await asyncio.gather(
+            *(
+                fetch_and_save(filename, request)
+                for filename, request in endpoints.items()
+            ),
+            return_exceptions=True,
+        )
+
+    failed = 0
+    for filename, result in zip(endpoints, results, strict=True):
+        if isinstance(result, Exception):
+            # il file precedente (se esiste) resta com'è
+            print(f"  ERRORE {filename}: {result!r} — non salvato")
+            failed += 1
+
+    print(f"\ndone ({failed} errori)." if failed else "\ndone.")
+    if failed:
+        raise SystemExit(1)
 
 
 if __name__ == "__main__":
@@ -4,17 +4,23 @@
 #     "aiohttp",
 #     "datapizza-ai",
 #     "datapizza-ai-clients-openai-like",
+#     "orjson",
 #     "python-dotenv"
 # ]
 # ///
 
 import asyncio
-import json
+import contextvars
+import logging
 import os
-from datetime import datetime
+import random
+import time
+from collections import deque
+from dataclasses import dataclass, field
 from typing import Any, Awaitable, Callable
 
 import aiohttp
+import orjson
 from dotenv import load_dotenv
 
 from server_client import HackapizzaClient
@@ -24,19 +30,54 @@ load_dotenv()
 TEAM_ID: int = 24  # <-- imposta il tuo team ID
 TEAM_API_KEY: str = os.getenv("API_KEY", "")
 BASE_URL: str = "https://hackapizza.datapizza.tech"
+SSE_QUEUE_SIZE: int = 1024  # righe SSE bufferizzate mentre un handler è occupato
+HEARTBEAT_PREFIX: bytes = b'{"type":"heartbeat"'
+RECONNECT_BACKOFF_MIN: float = 0.5  # secondi
+RECONNECT_BACKOFF_MAX: float = 30.0
+CONSUMER_SHUTDOWN_TIMEOUT: float = 2.0
+# stessa fase ripetuta entro questo intervallo (misurato all'arrivo) = duplicato
+PHASE_DEBOUNCE_S: float = 0.5
 
 if not TEAM_API_KEY or not TEAM_ID:
     raise SystemExit("Imposta API_KEY nel file .env e TEAM_ID in main.py")
 
+# Client condiviso da tutti gli handler: la sessione HTTP viene aperta una
+# volta sola in main() e riusata per tutta la partita
+api = HackapizzaClient(BASE_URL, TEAM_API_KEY, TEAM_ID)
 
-def log(tag: str, message: str) -> None:
-    print(f"[{tag}] {datetime.now()}: {message}")
 
+logger = logging.getLogger("hackapizza")
 
-# Stato condiviso del turno corrente
-current_turn_id: int = 0
-pending_orders: list[dict[str, Any]] = []   # clienti in attesa durante serving
-prepared_dishes: list[str] = []             # piatti pronti da servire
+# istante (monotonic) in cui la riga SSE in gestione è arrivata dal socket:
+# gli handler girano dopo, quando il consumer arriva a quella riga
+event_received_at: contextvars.ContextVar[float] = contextvars.ContextVar(
+    "event_received_at"
+)
+
+
+def log(tag: str, message: str, *args: Any, level: int = logging.INFO) -> None:
+    """Log con prefisso `[tag]`; `args` formattati stile `%s` solo se necessario."""
+    logger.log(level, "[%s] " + message, tag, *args)
+
+
+@dataclass(slots=True)
+class TurnState:
+    """Stato condiviso del turno corrente."""
+
+    turn_id: int = 0
+    # clienti in attesa (FIFO)
+    pending_orders: deque[dict[str, Any]] = field(default_factory=deque)
+    # piatti pronti da servire
+    prepared_dishes: list[str] = field(default_factory=list)
+    # ultimo cambio fase gestito: (fase, turn_id, monotonic)
+    last_phase: tuple[str, int, float] = ("", 0, 0.0)
+
+    def clear(self) -> None:
+        self.pending_orders.clear()
+        self.prepared_dishes.clear()
+
+
+state = TurnState()
 
 
 # -------------------------------------------------------------------------
@@ -44,94 +85,99 @@ prepared_dishes: list[str] = []             # piatti pronti da servire
 # -------------------------------------------------------------------------
 
 async def game_started(data: dict[str, Any]) -> None:
-    global current_turn_id
-    current_turn_id = data.get("turn_id", 0)
-    log("EVENT", f"game started | turn_id={current_turn_id}")
+    state.turn_id = data.get("turn_id", 0)
+    api.clear_cache()  # nuova partita: le ricette potrebbero essere cambiate
+    log("EVENT", "game started | turn_id=%s", state.turn_id)
 
 
 async def speaking_phase_started() -> None:
     log("PHASE", "speaking")
-    async with HackapizzaClient(BASE_URL, TEAM_API_KEY, TEAM_ID) as client:
-        info = await client.get_restaurant()
-        log("INFO", f"saldo={info.get('balance')} | inventario={info.get('inventory')}")
+    info = await api.get_restaurant()
+    log("INFO", "saldo=%s | inventario=%s", info.get("balance"), info.get("inventory"))
 
 
 async def closed_bid_phase_started() -> None:
     log("PHASE", "closed_bid")
-    async with HackapizzaClient(BASE_URL, TEAM_API_KEY, TEAM_ID) as client:
-        recipes = await client.get_recipes()
-        log("INFO", f"ricette disponibili: {len(recipes)}")
+    recipes = await api.get_recipes()
+    log("INFO", "ricette disponibili: %d", len(recipes))
 
-        # Esempio: offerta placeholder — sostituisci con la logica reale dell'agente
-        # bids = [{"ingredient": "Farina Cosmica", "bid": 10.0, "quantity": 2}]
-        # await client.closed_bid(bids)
+    # Esempio: offerta placeholder — sostituisci con la logica reale dell'agente
+    # bids = [{"ingredient": "Farina Cosmica", "bid": 10.0, "quantity": 2}]
+    # await api.closed_bid(bids)
 
 
 async def waiting_phase_started() -> None:
     log("PHASE", "waiting")
-    async with HackapizzaClient(BASE_URL, TEAM_API_KEY, TEAM_ID) as client:
-        inventory = (await client.get_restaurant()).get("inventory", {})
-        log("INFO", f"inventario aggiornato: {inventory}")
+    inventory = (await api.get_restaurant()).get("inventory", {})
+    log("INFO", "inventario aggiornato: %s", inventory)
 
-        # Esempio: imposta il menu — sostituisci con la logica reale dell'agente
-        # await client.save_menu([{"name": "Pizza Cosmica", "price": 25.0}])
+    # Esempio: imposta il menu — sostituisci con la logica reale dell'agente
+    # await api.save_menu([{"name": "Pizza Cosmica", "price": 25.0}])
 
 
 async def serving_phase_started() -> None:
     log("PHASE", "serving")
-    pending_orders.clear()
-    prepared_dishes.clear()
+    state.clear()
 
 
 async def end_turn() -> None:
     log("PHASE", "stopped — turno terminato")
-    pending_orders.clear()
-    prepared_dishes.clear()
+    state.clear()
 
 
 async def client_spawned(data: dict[str, Any]) -> None:
     client_name = data.get("clientName", "unknown")
     client_id = data.get("clientId", "")
     order_text = str(data.get("orderText", ""))
-    log("CLIENT", f"nome={client_name} | ordine={order_text}")
+    log("CLIENT", "nome=%s | ordine=%s", client_name, order_text)
 
-    pending_orders.append({
+    state.pending_orders.append({
         "client_id": client_id,
         "client_name": client_name,
         "order_text": order_text,
     })
 
     # Esempio: prepara e servi — sostituisci con logica reale dell'agente
-    # async with HackapizzaClient(BASE_URL, TEAM_API_KEY, TEAM_ID) as client:
-    #     await client.prepare_dish("Pizza Cosmica")
+    # await api.prepare_dish("Pizza Cosmica")
 
 
 async def preparation_complete(data: dict[str, Any]) -> None:
     dish_name = data.get("dish", "unknown")
-    log("KITCHEN", f"piatto pronto: {dish_name}")
-    prepared_dishes.append(dish_name)
+    log("KITCHEN", "piatto pronto: %s", dish_name)
+    state.prepared_dishes.append(dish_name)
 
     # Esempio: servi il piatto al primo cliente in attesa
-    # if pending_orders:
-    #     order = pending_orders.pop(0)
-    #     async with HackapizzaClient(BASE_URL, TEAM_API_KEY, TEAM_ID) as client:
-    #         await client.serve_dish(dish_name, order["client_id"])
+    # if state.pending_orders:
+    #     order = state.pending_orders.popleft()
+    #     await api.serve_dish(dish_name, order["client_id"])
 
 
 async def message(data: dict[str, Any]) -> None:
     sender = data.get("sender", "unknown")
     payload = data.get("payload", "")
-    log("MSG", f"da={sender}: {payload}")
+    log("MSG", "da=%s: %s", sender, payload)
 
 
 async def new_message(data: dict[str, Any]) -> None:
     sender_name = data.get("senderName", "unknown")
     text = data.get("text", "")
-    log("MSG", f"privato da={sender_name}: {text}")
+    log("MSG", "privato da=%s: %s", sender_name, text)
 
 
 async def game_phase_changed(data: dict[str, Any]) -> None:
     phase = data.get("phase", "unknown")
+    # l'SSE può consegnare lo stesso cambio fase due volte di fila: il
+    # duplicato rifarebbe le chiamate REST (e in serving svuoterebbe gli ordini).
+    # Si confrontano i tempi di arrivo, non di gestione: dietro un handler
+    # lento i due eventi verrebbero gestiti a distanza maggiore della finestra
+    now = event_received_at.get(time.monotonic())
+    last_phase, last_turn_id, last_at = state.last_phase
+    same_phase = (phase, state.turn_id) == (last_phase, last_turn_id)
+    if same_phase and now - last_at < PHASE_DEBOUNCE_S:
+        log("EVENT", "fase duplicata ignorata: %s", phase, level=logging.DEBUG)
+        return
+    state.last_phase = (phase, state.turn_id, now)
+
     handlers: dict[str, Callable[[], Awaitable[None]]] = {
         "speaking": speaking_phase_started,
         "closed_bid": closed_bid_phase_started,
@@ -143,13 +189,14 @@ async def game_phase_changed(data: dict[str, Any]) -> None:
     if handler:
         await handler()
     else:
-        log("EVENT", f"fase sconosciuta: {phase}")
+        log("EVENT", "fase sconosciuta: %s", phase)
 
 
 async def game_reset(data: dict[str, Any]) -> None:
-    global current_turn_id
-    current_turn_id = 0
-    pending_orders.clear()
+    state.turn_id = 0
+    state.last_phase = ("", 0, 0.0)
+    state.clear()
+    api.clear_cache()
     log("EVENT", "game reset")
 
 
@@ -171,30 +218,32 @@ async def dispatch_event(event_type: str, event_data: dict[str, Any]) -> None:
     handler = EVENT_HANDLERS.get(event_type)
     if not handler:
         if event_type not in ("heartbeat",):  # ignora heartbeat silenziosamente
-            log("EVENT", f"nessun handler per: {event_type}")
+            log("EVENT", "nessun handler per: %s", event_type, level=logging.DEBUG)
         return
     try:
         await handler(event_data)
     except Exception as exc:
-        log("ERROR", f"handler fallito per {event_type}: {exc}")
+        log("ERROR", "handler fallito per %s: %s", event_type, exc, level=logging.ERROR)
 
 
 async def handle_line(raw_line: bytes) -> None:
-    if not raw_line:
-        return
-    line = raw_line.decode("utf-8", errors="ignore").strip()
+    # Framing SSE direttamente sui bytes (orjson li accetta così come sono):
+    # si decodifica in str solo per loggare le righe non JSON
+    line = raw_line.strip()
     if not line:
         return
-    if line.startswith("data:"):
-        payload = line[5:].strip()
-        if payload == "connected":
+    if line.startswith(b"data:"):
+        line = line[5:].strip()
+        if line == b"connected":
             log("SSE", "connesso")
             return
-        line = payload
+    if line.startswith(HEARTBEAT_PREFIX):
+        return  # evento più frequente e senza handler: niente parse JSON
     try:
-        event_json = json.loads(line)
-    except json.JSONDecodeError:
-        log("SSE", f"raw: {line}")
+        event_json = orjson.loads(line)
+    except orjson.JSONDecodeError:
+        raw = line.decode("utf-8", errors="ignore")
+        log("SSE", "riga non JSON: %s", raw, level=logging.WARNING)
         return
     event_type = event_json.get("type", "unknown")
     event_data = event_json.get("data", {})
@@ -204,48 +253,111 @@ async def handle_line(raw_line: bytes) -> None:
         await dispatch_event(event_type, {"value": event_data})
 
 
-async def listen_once(session: aiohttp.ClientSession) -> None:
+async def consume_lines(queue: asyncio.Queue[tuple[float, bytes]]) -> None:
+    # Un solo consumer: gli eventi vanno gestiti nell'ordine in cui arrivano
+    # (un cambio fase svuota lo stato del turno)
+    while True:
+        received_at, line = await queue.get()
+        event_received_at.set(received_at)
+        try:
+            await handle_line(line)
+        except Exception as exc:
+            log("ERROR", "evento SSE scartato: %s", exc, level=logging.ERROR)
+        finally:
+            queue.task_done()
+
+
+async def listen_once(
+    session: aiohttp.ClientSession, on_open: Callable[[], None] | None = None
+) -> None:
     url = f"{BASE_URL}/events/{TEAM_ID}"
     headers = {"Accept": "text/event-stream", "x-api-key": TEAM_API_KEY}
-    async with session.get(url, headers=headers) as response:
-        response.raise_for_status()
-        log("SSE", "connessione aperta")
-        async for line in response.content:
-            await handle_line(line)
+    # Il socket viene letto qui, gli handler girano nel consumer: un handler
+    # lento (es. chiamata REST) non blocca la lettura dello stream
+    queue: asyncio.Queue[tuple[float, bytes]] = asyncio.Queue(maxsize=SSE_QUEUE_SIZE)
+    consumer = asyncio.create_task(consume_lines(queue))
+    try:
+        async with session.get(url, headers=headers) as response:
+            response.raise_for_status()
+            log("SSE", "connessione aperta")
+            if on_open:
+                on_open()
+            async for line in response.content:
+                await queue.put((time.monotonic(), line))
+    except Exception:
+        # connessione caduta: gestisce comunque gli eventi già ricevuti
+        await queue.join()
+        raise
+    else:
+        await queue.join()
+    finally:
+        # Nelle uscite normali la coda è già stata svuotata e il consumer è
+        # fermo su queue.get(); se invece listen_once viene cancellata può
+        # essere a metà di un handler: gli diamo un tempo massimo per chiudersi
+        consumer.cancel()
+        _, pending = await asyncio.wait({consumer}, timeout=CONSUMER_SHUTDOWN_TIMEOUT)
+        if pending:
+            log(
+                "SSE", "consumer non terminato entro %.1fs", CONSUMER_SHUTDOWN_TIMEOUT,
+                level=logging.WARNING,
+            )
 
 
 async def listen_with_reconnect() -> None:
     """SSE con reconnect automatico in caso di caduta della connessione."""
     timeout = aiohttp.ClientTimeout(total=None, sock_connect=15, sock_read=None)
-    while True:
-        try:
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                await listen_once(session)
-        except aiohttp.ClientError as exc:
-            log("SSE", f"connessione persa: {exc} — riconnessione in 5s")
-            await asyncio.sleep(5)
-        except Exception as exc:
-            log("ERROR", f"errore inatteso SSE: {exc} — riconnessione in 5s")
-            await asyncio.sleep(5)
-        else:
-            log("SSE", "connessione chiusa dal server — riconnessione in 5s")
-            await asyncio.sleep(5)
+    backoff = RECONNECT_BACKOFF_MIN
+
+    def reset_backoff() -> None:
+        nonlocal backoff
+        backoff = RECONNECT_BACKOFF_MIN
+
+    # una sola sessione (e connector) per tutte le riconnessioni
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        while True:
+            try:
+                # appena lo stream è aperto il backoff riparte dal minimo
+                await listen_once(session, on_open=reset_backoff)
+            except aiohttp.ClientError as exc:
+                log("SSE", "connessione persa: %s", exc, level=logging.WARNING)
+            except Exception as exc:
+                log("ERROR", "errore inatteso SSE: %s", exc, level=logging.ERROR)
+            else:
+                log("SSE", "connessione chiusa dal server")
+
+            # backoff esponenziale con jitter: cresce solo finché la connessione
+            # non riesce ad aprirsi (errori di connect / HTTP)
+            delay = backoff + random.uniform(0, backoff / 2)
+            log("SSE", "riconnessione in %.1fs", delay)
+            await asyncio.sleep(delay)
+            backoff = min(backoff * 2, RECONNECT_BACKOFF_MAX)
 
 
 async def main() -> None:
-    log("INIT", f"team={TEAM_ID} base_url={BASE_URL}")
-    # Mostra info iniziali ristorante
-    async with HackapizzaClient(BASE_URL, TEAM_API_KEY, TEAM_ID) as client:
+    log("INIT", "team=%s base_url=%s", TEAM_ID, BASE_URL)
+    async with api:
+        # Mostra info iniziali ristorante
         try:
-            info = await client.get_restaurant()
-            log("INIT", f"ristorante: {info.get('name')} | saldo: {info.get('balance')}")
+            info = await api.get_restaurant()
+            log(
+                "INIT",
+                "ristorante: %s | saldo: %s",
+                info.get("name"),
+                info.get("balance"),
+            )
         except Exception as exc:
-            log("INIT", f"impossibile ottenere info ristorante: {exc}")
+            log(
+                "INIT",
+                "impossibile ottenere info ristorante: %s",
+                exc,
+                level=logging.WARNING,
+            )
 
-    await listen_with_reconnect()
+        await listen_with_reconnect()
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
@@ -3,11 +3,11 @@ Hackapizza 2.0 - Server Client
 Wrapper per tutti gli endpoint HTTP GET e MCP tools del server di gioco.
 """
 
-import json
 import uuid
 from typing import Any
 
 import aiohttp
+import orjson
 
 
 class HackapizzaClient:
@@ -18,6 +18,7 @@ class HackapizzaClient:
         self.api_key = api_key
         self.restaurant_id = restaurant_id
         self._session: aiohttp.ClientSession | None = None
+        self._recipes: list[dict[str, Any]] | None = None
 
     @property
     def _headers(self) -> dict[str, str]:
@@ -25,7 +26,12 @@ class HackapizzaClient:
 
     async def __aenter__(self) -> "HackapizzaClient":
         timeout = aiohttp.ClientTimeout(total=30)
-        self._session = aiohttp.ClientSession(timeout=timeout)
+        # keep-alive + cache DNS: le chiamate dentro lo stesso `async with`
+        # riusano la connessione TLS invece di rifare l'handshake
+        connector = aiohttp.TCPConnector(
+            limit_per_host=10, keepalive_timeout=30, ttl_dns_cache=300
+        )
+        self._session = aiohttp.ClientSession(timeout=timeout, connector=connector)
         return self
 
     async def __aexit__(self, *_: Any) -> None:
@@ -40,6 +46,7 @@ class HackapizzaClient:
 
     # -------------------------------------------------------------------------
     # HTTP GET endpoints
+    # (orjson parsa direttamente i bytes della risposta, senza decode del charset)
     # -------------------------------------------------------------------------
 
     async def get_meals(self, turn_id: int) -> list[dict[str, Any]]:
@@ -50,7 +57,7 @@ class HackapizzaClient:
             f"{self.base_url}/meals", headers=self._headers, params=params
         ) as resp:
             resp.raise_for_status()
-            return await resp.json()
+            return orjson.loads(await resp.read())
 
     async def get_restaurants(self) -> list[dict[str, Any]]:
         """GET /restaurants — overview di tutti i ristoranti in gioco."""
@@ -59,16 +66,28 @@ class HackapizzaClient:
             f"{self.base_url}/restaurants", headers=self._headers
         ) as resp:
             resp.raise_for_status()
-            return await resp.json()
+            return orjson.loads(await resp.read())
 
-    async def get_recipes(self) -> list[dict[str, Any]]:
-        """GET /recipes — array ricette con ingredienti e tempi."""
-        session = self._require_session()
-        async with session.get(
-            f"{self.base_url}/recipes", headers=self._headers
-        ) as resp:
-            resp.raise_for_status()
-            return await resp.json()
+    async def get_recipes(self, refresh: bool = False) -> list[dict[str, Any]]:
+        """
+        GET /recipes — array ricette con ingredienti e tempi.
+        Le ricette non cambiano durante la partita: la prima risposta resta in
+        cache sull'istanza (refresh=True o clear_cache() per rileggerle).
+        Ritorna una copia della lista, ma i dict delle ricette sono condivisi
+        con la cache: trattali come read-only.
+        """
+        if self._recipes is None or refresh:
+            session = self._require_session()
+            async with session.get(
+                f"{self.base_url}/recipes", headers=self._headers
+            ) as resp:
+                resp.raise_for_status()
+                self._recipes = orjson.loads(await resp.read())
+        return list(self._recipes)
+
+    def clear_cache(self) -> None:
+        """Dimentica i dati statici in cache (da chiamare a ogni nuova partita o reset)."""
+        self._recipes = None
 
     async def get_bid_history(self, turn_id: int) -> list[dict[str, Any]]:
         """GET /bid_history — storico bid di tutti i team per un dato turno."""
@@ -79,7 +98,7 @@ class HackapizzaClient:
             params={"turn_id": turn_id},
         ) as resp:
             resp.raise_for_status()
-            return await resp.json()
+            return orjson.loads(await resp.read())
 
     async def get_restaurant(self) -> dict[str, Any]:
         """GET /restaurant/:id — dettaglio del proprio ristorante."""
@@ -88,7 +107,7 @@ class HackapizzaClient:
             f"{self.base_url}/restaurant/{self.restaurant_id}", headers=self._headers
         ) as resp:
             resp.raise_for_status()
-            return await resp.json()
+            return orjson.loads(await resp.read())
 
     async def get_menu(self) -> list[dict[str, Any]]:
         """GET /restaurant/:id/menu — voci del menu del proprio ristorante."""
@@ -98,7 +117,7 @@ class HackapizzaClient:
             headers=self._headers,
         ) as resp:
             resp.raise_for_status()
-            return await resp.json()
+            return orjson.loads(await resp.read())
 
     async def get_market_entries(self) -> list[dict[str, Any]]:
         """GET /market/entries — entry di mercato attive/chiuse."""
@@ -107,7 +126,7 @@ class HackapizzaClient:
             f"{self.base_url}/market/entries", headers=self._headers
         ) as resp:
             resp.raise_for_status()
-            return await resp.json()
+            return orjson.loads(await resp.read())
 
     # -------------------------------------------------------------------------
     # MCP tools (POST /mcp, JSON-RPC)
@@ -125,10 +144,10 @@ class HackapizzaClient:
         async with session.post(
             f"{self.base_url}/mcp",
             headers=self._headers,
-            data=json.dumps(payload),
+            data=orjson.dumps(payload),
         ) as resp:
             resp.raise_for_status()
-            result = await resp.json()
+            result = orjson.loads(await resp.read())
         # Unwrap JSON-RPC result
         if "error" in result:
             raise RuntimeError(f"MCP error: {result['error']}")
@@ -0,0 +1,64 @@
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("aiohttp")
+pytest.importorskip("dotenv")
+
+# main.py è uno script: importa server_client dalla sua cartella e richiede
+# API_KEY già all'import
+sys.path.insert(0, str(Path(__file__).parents[1]))
+os.environ.setdefault("API_KEY", "test_api_key")
+
+import main
+
+SPEAKING = b'data: {"type":"game_phase_changed","data":{"phase":"speaking"}}\n'
+
+
+class FakeResponse:
+    def __init__(self, lines):
+        self.content = self._iter(lines)
+
+    @staticmethod
+    async def _iter(lines):
+        for line in lines:
+            yield line
+
+    def raise_for_status(self):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class FakeSession:
+    def __init__(self, lines):
+        self.lines = lines
+
+    def get(self, url, headers=None):
+        return FakeResponse(self.lines)
+
+
+def test_duplicate_phase_behind_slow_handler(monkeypatch):
+    calls = 0
+
+    async def slow_get_restaurant():
+        nonlocal calls
+        calls += 1
+        # più lungo di PHASE_DEBOUNCE_S: il duplicato viene gestito dopo la
+        # finestra, ma è arrivato insieme al primo
+        await asyncio.sleep(0.8)
+        return {}
+
+    monkeypatch.setattr(main.api, "get_restaurant", slow_get_restaurant)
+    monkeypatch.setattr(main, "state", main.TurnState(turn_id=1))
+
+    asyncio.run(main.listen_once(FakeSession([SPEAKING, SPEAKING])))
+
+    assert calls == 1